@@ -1,7 +1,8 @@
+import math
+from functools import lru_cache
 import streamlit as st
 import numpy as np
 import pandas as pd
-from scipy.optimize import brentq
 
 # Page Config
 st.set_page_config(page_title="Vacuum Conductance Calculator", layout="wide")
@@ -12,53 +13,176 @@ st.caption("Gas: Cl2 / Temp: 293K / Pressure: 1.1Pa (Transition Flow)")
 if 'cond_snapshots' not in st.session_state:
     st.session_state.cond_snapshots = []
 
+# --- Derived Constants (cached across reruns) ---
+R_gas = 8.314
+
+@st.cache_data
+def derive_constants(T, M_val, mu_val):
+    M = M_val * 1e-3
+    return dict(M=M, mu=mu_val * 1e-5, v_avg=math.sqrt(8 * R_gas * T / (math.pi * M)))
+
 # --- Sidebar: Constants & Settings ---
 with st.sidebar:
     st.header("Constants & Settings")
-    T = st.number_input("Temperature T [K]", value=293.0)
-    P_avg = st.number_input("Avg Pressure P_avg [Pa]", value=1.1)
-    Delta_P = st.number_input("Diff Pressure ΔP [Pa]", value=1.8) 
-    M_val = st.number_input("Molar Mass M [g/mol]", value=70.9) 
-    mu_val = st.number_input("Dynamic Viscosity μ [1e-5 Pa s]", value=1.32)
+    st.number_input("Temperature T [K]", value=293.0, min_value=1.0, key="T")
+    st.number_input("Avg Pressure P_avg [Pa]", value=1.1, min_value=0.01, key="P_avg")
+    st.number_input("Diff Pressure ΔP [Pa]", value=1.8, key="Delta_P") 
+    st.number_input("Molar Mass M [g/mol]", value=70.9, min_value=0.1, key="M_val") 
+    st.number_input("Dynamic Viscosity μ [1e-5 Pa s]", value=1.32, min_value=0.0, key="mu_val")
+    T, P_avg, Delta_P, M_val, mu_val = (st.session_state[k] for k in ("T", "P_avg", "Delta_P", "M_val", "mu_val"))
     
-    # Unit Conversion
-    R_gas = 8.314
-    M = M_val * 1e-3
-    mu = mu_val * 1e-5
-    v_avg = np.sqrt(8 * R_gas * T / (np.pi * M))
+    # Unit Conversion (only redone when one of the gas inputs changes)
+    gas_key = (T, M_val, mu_val)
+    if st.session_state.get("gas_key") != gas_key:
+        st.session_state.gas_key = gas_key
+        st.session_state.gas_constants = derive_constants(*gas_key)
+    gas_constants = st.session_state.gas_constants
+    M, mu, v_avg = gas_constants["M"], gas_constants["mu"], gas_constants["v_avg"]
     st.markdown("---")
     st.write(f"Mean Molecular Speed: **{v_avg:.1f} m/s**")
 
 # --- Calculation Logic ---
-def calc_C_single(L_m, D_m):
-    if L_m <= 0 or D_m <= 0: return 1e-20
-    r = D_m / 2
-    A = np.pi * r**2
-    alpha = 1 / (1 + (3 * L_m) / (4 * D_m))
-    C_mol = (1/4) * A * v_avg * alpha
-    C_visc = (np.pi * D_m**4 * P_avg) / (128 * mu * L_m)
-    return 1 / ((1/C_mol) + (1/C_visc))
+# Specialize the single-hole formula on the session's gas constants: they are
+# folded in once, so each call is a few multiplies and one division.
+def make_C_single(v_avg, P_avg, mu):
+    inv_kmol_num = 4.0 / (math.pi * v_avg)
+    k_visc_inv_num = 128.0 * mu / (math.pi * P_avg)
+    def C_single(L_m, D_m):
+        if L_m <= 0 or D_m <= 0: return 1e-20
+        r2 = 0.25 * D_m * D_m
+        inv_C_mol = inv_kmol_num * (1 + 0.75 * L_m / D_m) / r2
+        inv_C_visc = k_visc_inv_num * L_m / D_m**4
+        return 1.0 / (inv_C_mol + inv_C_visc)
+    return C_single
 
-# --- Helper to create and Save snapshot ---
-def handle_results(L_mm, D_mm, N, label=""):
+# brenth residuals: the parts that depend only on the fixed argument are
+# hoisted out and passed via args
+def _residual_D(D_m, k_mol, k_visc, alpha_c, C_target):
+    C_mol = k_mol * (D_m * 0.5)**2 / (1 + alpha_c / D_m)
+    C_visc = k_visc * D_m**4
+    return 1 / ((1/C_mol) + (1/C_visc)) - C_target
+
+def _residual_L(L_m, a, b, C_target):
+    return 1 / (a * L_m + b) - C_target
+
+def residual_D_args(L_m, C_target):
+    # Fixed L: k_mol, k_visc and the alpha term no longer change per iteration
+    return (0.25 * math.pi * v_avg, math.pi * P_avg / (128 * mu * L_m), 0.75 * L_m, C_target)
+
+def residual_L_args(D_m, C_target):
+    # Fixed D: 1/C = a*L + b
+    a = 12 / (math.pi * v_avg * D_m**3) + 128 * mu / (math.pi * D_m**4 * P_avg)
+    b = 16 / (math.pi * v_avg * D_m**2)
+    return (a, b, C_target)
+
+# Specialized + memoized kernel, rebuilt only when the constants change
+C_single_key = (v_avg, P_avg, mu)
+if st.session_state.get("C_single_key") != C_single_key:
+    st.session_state.C_single_key = C_single_key
+    st.session_state.C_single = lru_cache(maxsize=4096)(make_C_single(*C_single_key))
+calc_C_single = st.session_state.C_single
+
+# Array version for geometry sweeps (one NumPy pass instead of a Python loop)
+def calc_C_single_vec(L_m, D_m):
+    L_m, D_m = np.broadcast_arrays(np.asarray(L_m, dtype=float), np.asarray(D_m, dtype=float))
+    valid = (L_m > 0) & (D_m > 0)
+    L_m, D_m = np.where(valid, L_m, 1.0), np.where(valid, D_m, 1.0)
+    A = math.pi * (D_m * 0.5)**2
+    alpha = 1.0 / (1.0 + 0.75 * L_m / D_m)
+    inv_C_mol = 1.0 / (0.25 * A * v_avg * alpha)
+    inv_C_visc = 128 * mu * L_m / (math.pi * D_m**4 * P_avg)
+    return np.where(valid, 1.0 / (inv_C_mol + inv_C_visc), 1e-20)
+
+# --- Closed-form Inversion ---
+# 1/C = 16/(pi v D^2) + 12 L/(pi v D^3) + 128 mu L/(pi D^4 P)
+def solve_D_closed(L_m, C_target, D_min=1e-5, D_max=0.050):
+    # Multiply through by D^4: quartic in D with a single positive root
+    if L_m <= 0 or C_target <= 0: return None
+    k_mol = math.pi * v_avg
+    coeffs = [1 / C_target, 0, -16 / k_mol, -12 * L_m / k_mol, -128 * mu * L_m / (math.pi * P_avg)]
+    roots = np.roots(coeffs)
+    roots = roots.real[np.isclose(roots.imag, 0)]
+    roots = roots[(roots >= D_min) & (roots <= D_max)]
+    return roots.min() if roots.size else None
+
+def solve_L_closed(D_m, C_target, L_min=1e-4, L_max=1.0):
+    # Linear in L: a*L + b = 1/C_target
+    if D_m <= 0 or C_target <= 0: return None
+    a, b, _ = residual_L_args(D_m, C_target)
+    L_m = (1 / C_target - b) / a
+    return L_m if L_min <= L_m <= L_max else None
+
+# --- Batched Inversion ---
+# SciPy is a heavy import and only the batch D solve and the brenth fallbacks
+# need it, so it is imported lazily there rather than at script start.
+def _find_root_batch(f, init, *, args=()):
+    # Vectorized Chandrupatla: one call for all points
+    try:
+        from scipy.optimize.elementwise import find_root
+    except ImportError:  # SciPy 1.12-1.14 only ships the private implementation
+        from scipy.optimize._chandrupatla import _chandrupatla
+        return _chandrupatla(f, *init, args=args)
+    return find_root(f, init, args=args)
+
+def solve_D_batch(L_m, C_target):
+    L_m, C_target = np.broadcast_arrays(np.asarray(L_m, dtype=float), np.asarray(C_target, dtype=float))
+    bracket = (np.full(L_m.shape, 1e-5), np.full(L_m.shape, 0.050))
+    res = _find_root_batch(lambda D, L, Ct: calc_C_single_vec(L, D) - Ct, bracket, args=(L_m, C_target))
+    return np.where(res.success, res.x, np.nan)
+
+def solve_L_batch(D_m, C_target, L_min=1e-4, L_max=1.0):
+    # Linear in L, so the closed form vectorizes directly
+    D_m, C_target = np.broadcast_arrays(np.asarray(D_m, dtype=float), np.asarray(C_target, dtype=float))
+    valid = (D_m > 0) & (C_target > 0)
+    D_m, C_target = np.where(valid, D_m, 1.0), np.where(valid, C_target, 1.0)
+    a, b, _ = residual_L_args(D_m, C_target)
+    L_m = (1 / C_target - b) / a
+    return np.where(valid & (L_m >= L_min) & (L_m <= L_max), L_m, np.nan)
+
+# --- Report (cached on geometry + sidebar constants) ---
+@st.cache_data(max_entries=256)
+def generate_report(L_mm, D_mm, N, P_avg, Delta_P, v_avg, mu):
+    # calc_C_single inlined so the hole area and 1/C terms are computed once
     L_m, D_m = L_mm * 1e-3, D_mm * 1e-3
-    C_single = calc_C_single(L_m, D_m)
-    C_total = C_single * N
-    V_total = N * (np.pi * (D_m/2)**2) * L_m
+    r_m = D_m * 0.5
+    A = math.pi * r_m * r_m
+    if L_m <= 0 or D_m <= 0:
+        C_total = 1e-20 * N
+    else:
+        inv_C_mol = 4 * (1 + 0.75 * L_m / D_m) / (A * v_avg)
+        inv_C_visc = 128 * mu * L_m / (math.pi * D_m**4 * P_avg)
+        C_total = N / (inv_C_mol + inv_C_visc)
+    V_total = N * A * L_m
     Q = C_total * Delta_P
     Res_Time = ((P_avg * V_total) / Q) * 1000 if Q > 0 else 0
-    
-    # 1. Display Current Result
-    st.success(f"Result: Overall Conductance = {C_total:.5f} m³/s")
-    res_data = {
+    # Raw floats; formatting is applied only at display time
+    return {
         "Thickness [mm]": L_mm,
         "Diameter [mm]": D_mm,
         "Holes": int(N),
-        "C_total [m³/s]": round(C_total, 5),
-        "Flux Q": round(Q, 4),
-        "Res. Time [ms]": round(Res_Time, 2)
+        "C_total [m³/s]": C_total,
+        "Flux Q": Q,
+        "Res. Time [ms]": Res_Time
     }
-    st.table(pd.DataFrame([res_data]))
+
+# Single result = a handful of scalars, so show metrics instead of a one-row table
+def display_report(res_data):
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Thickness", f"{res_data['Thickness [mm]']:.3f} mm")
+    c2.metric("Diameter", f"{res_data['Diameter [mm]']:.3f} mm")
+    c3.metric("Holes", f"{res_data['Holes']:,}")
+    c1, c2, c3 = st.columns(3)
+    c1.metric("C_total", f"{res_data['C_total [m³/s]']:.5f} m³/s")
+    c2.metric("Flux Q", f"{res_data['Flux Q']:.4f} Pa·m³/s")
+    c3.metric("Res. Time", f"{res_data['Res. Time [ms]']:.2f} ms")
+
+# --- Helper to create and Save snapshot ---
+def handle_results(L_mm, D_mm, N, label=""):
+    res_data = generate_report(L_mm, D_mm, N, P_avg, Delta_P, v_avg, mu)
+    
+    # 1. Display Current Result
+    st.success(f"Result: Overall Conductance = {res_data['C_total [m³/s]']:.5f} m³/s")
+    display_report(res_data)
     
     # 2. Snapshot Button
     if st.button(f"📸 Save this design ({label})"):
@@ -92,6 +216,14 @@ with tab2:
         N2 = Ct2 / calc_C_single(L2*1e-3, D2*1e-3)
         handle_results(L2, D2, int(round(N2)), "Tab2")
 
+    st.markdown("---")
+    # Every tab body runs on each rerun, so the sweep is only built on request
+    if st.toggle("Show Diameter Sweep (required holes at the thickness above)", key="show_D2_sweep"):
+        D2_lo, D2_hi = st.slider("Diameter Range [mm]", 0.1, 20.0, (1.0, 5.0), step=0.1, key="D2_sweep")
+        D2_sweep = np.linspace(D2_lo, D2_hi, 200)
+        N2_sweep = Ct2 / calc_C_single_vec(L2*1e-3, D2_sweep*1e-3)
+        st.line_chart(pd.DataFrame({"Diameter [mm]": D2_sweep, "Required Holes N": N2_sweep}), x="Diameter [mm]", y="Required Holes N")
+
 with tab3:
     st.subheader("Solve for Required Hole Diameter")
     c1, c2, c3 = st.columns(3)
@@ -99,12 +231,26 @@ with tab3:
     N3 = c2.number_input("Number of Holes N", value=1000, key="N3")
     Ct3 = c3.number_input("Target Conductance [m³/s]", value=0.0157, format="%.5f", key="Ct3")
     if st.button("Run Solver", key="btn3"):
-        def func(D_guess): return calc_C_single(L3*1e-3, D_guess) - (Ct3/N3)
         try:
-            ans = brentq(func, 1e-5, 0.050)
+            ans = solve_D_closed(L3*1e-3, Ct3/N3)
+            if ans is None:
+                from scipy.optimize import brenth
+                ans = brenth(_residual_D, 1e-5, 0.050, args=residual_D_args(L3*1e-3, Ct3/N3))
             handle_results(L3, ans*1000, N3, "Tab3")
         except: st.error("No solution found.")
 
+    st.markdown("---")
+    st.markdown("**Batch Solve** (one diameter per thickness, same N and target)")
+    L3_batch = st.text_input("Plate Thicknesses L [mm] (Space separated)", "5 10 15 20", key="L3_batch")
+    if st.button("Run Batch Solver", key="btn3_batch"):
+        if N3 <= 0: st.error("Number of Holes N must be positive.")
+        else:
+            try:
+                L3_vals = np.array(L3_batch.split(), dtype=float)
+                D3_vals = solve_D_batch(L3_vals*1e-3, Ct3/N3) * 1000
+                st.dataframe(pd.DataFrame({"Thickness [mm]": L3_vals, "Diameter [mm]": D3_vals}), hide_index=True)
+            except ValueError: st.error("Input Error: Please enter numbers separated by space (e.g., '5 10').")
+
 with tab4:
     st.subheader("Solve for Plate Thickness")
     c1, c2, c3 = st.columns(3)
@@ -112,21 +258,45 @@ with tab4:
     N4 = c2.number_input("Number of Holes N", value=2200, key="N4")
     Ct4 = c3.number_input("Target Conductance [m³/s]", value=0.0157, format="%.5f", key="Ct4")
     if st.button("Run Solver", key="btn4"):
-        def func(L_guess): return calc_C_single(L_guess, D4*1e-3) - (Ct4/N4)
         try:
-            ans = brentq(func, 1e-4, 1.0)
+            ans = solve_L_closed(D4*1e-3, Ct4/N4)
+            if ans is None:
+                from scipy.optimize import brenth
+                ans = brenth(_residual_L, 1e-4, 1.0, args=residual_L_args(D4*1e-3, Ct4/N4))
             handle_results(ans*1000, D4, N4, "Tab4")
         except: st.error("No solution found.")
 
+    st.markdown("---")
+    st.markdown("**Batch Solve** (one thickness per diameter, same N and target)")
+    D4_batch = st.text_input("Hole Diameters D [mm] (Space separated)", "2.0 2.5 3.0", key="D4_batch")
+    if st.button("Run Batch Solver", key="btn4_batch"):
+        if N4 <= 0: st.error("Number of Holes N must be positive.")
+        else:
+            try:
+                D4_vals = np.array(D4_batch.split(), dtype=float)
+                L4_vals = solve_L_batch(D4_vals*1e-3, Ct4/N4) * 1000
+                st.dataframe(pd.DataFrame({"Diameter [mm]": D4_vals, "Thickness [mm]": L4_vals}), hide_index=True)
+            except ValueError: st.error("Input Error: Please enter numbers separated by space (e.g., '2.0 2.5').")
+
 # --- Tab 5: Snapshot Management ---
+# Display precision per column, applied by the frontend (no per-cell Styler strings)
+SNAPSHOT_FORMAT = {
+    "Thickness [mm]": "%.3f",
+    "Diameter [mm]": "%.3f",
+    "C_total [m³/s]": "%.5f",
+    "Flux Q": "%.4f",
+    "Res. Time [ms]": "%.2f",
+}
+SNAPSHOT_COLUMN_CONFIG = {c: st.column_config.NumberColumn(format=f) for c, f in SNAPSHOT_FORMAT.items()}
+
 with tab5:
     st.subheader("Saved Design Comparison")
     if st.session_state.cond_snapshots:
         df_all = pd.DataFrame(st.session_state.cond_snapshots)
-        st.dataframe(df_all, use_container_width=True)
+        st.dataframe(df_all, column_config=SNAPSHOT_COLUMN_CONFIG, use_container_width=True)
         
         col_dl, col_clr = st.columns(2)
-        csv = df_all.to_csv(index=False).encode('utf-8')
+        csv = df_all.to_csv(index=False, float_format="%.6g").encode('utf-8')
         col_dl.download_button("📥 Download All as CSV", data=csv, file_name="conductance_designs.csv", mime="text/csv")
         
         if col_clr.button("🗑️ Clear List"):
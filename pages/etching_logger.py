@@ -1,22 +1,155 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
+import csv
 import datetime
+from collections import deque
+import io
+import re
+import sqlite3
+import threading
 
 # Page Configuration
 st.set_page_config(page_title="Etching Data Logger", layout="wide")
 st.title("⚗️ Etching Data Logger (3-Step Measurement)")
 st.caption("Inputs: Initial PR / Material Etch Depth / Total Step (PR + Depth)")
 
-# --- 1. Initialize Session State (For History) ---
-if 'etching_history' not in st.session_state:
-    st.session_state.etching_history = pd.DataFrame(columns=[
-        "Date", "Sample ID", "Time(min)", 
-        "Mat. Depth(nm)", "Total Step(nm)", "Rem. PR(nm)", "PR Loss(nm)",
-        "Mat. ER(nm/min)", "PR ER(nm/min)", "Selectivity", "Uniformity(±%)"
-    ])
+COLUMNS = (
+    "Date", "Sample ID", "Time(min)", 
+    "Mat. Depth(nm)", "Total Step(nm)", "Rem. PR(nm)", "PR Loss(nm)",
+    "Mat. ER(nm/min)", "PR ER(nm/min)", "Selectivity", "Uniformity(±%)"
+)
+
+# Column dtypes, declared once so pandas does not have to infer them. Arrow-
+# backed, so st.dataframe can hand the buffers over without converting
+# every cell (pyarrow ships with Streamlit)
+DTYPES = {c: "double[pyarrow]" for c in COLUMNS} | {"Date": "string[pyarrow]", "Sample ID": "string[pyarrow]"}
+
+# Display precision per numeric column (values are stored unrounded), applied
+# by the frontend rather than as per-cell Styler strings
+HISTORY_FORMAT = {
+    "Mat. Depth(nm)": "%.1f", "Total Step(nm)": "%.1f",
+    "Rem. PR(nm)": "%.1f", "PR Loss(nm)": "%.1f",
+    "Mat. ER(nm/min)": "%.2f", "PR ER(nm/min)": "%.2f",
+    "Selectivity": "%.2f", "Uniformity(±%)": "%.2f",
+}
+HISTORY_COLUMN_CONFIG = {c: st.column_config.NumberColumn(format=f) for c, f in HISTORY_FORMAT.items()}
+
+# --- 1. Persistent Store (SQLite) & Session State (For History) ---
+DB_PATH = "etching_log.db"
+HISTORY_LIMIT = 500
+# In-memory cap per session; older rows are evicted (they remain in the database)
+HISTORY_MAXLEN = 10_000
+# SQL column for each entry of COLUMNS (same order)
+DB_FIELDS = (
+    "date", "sample_id", "time_min",
+    "mat_depth", "total_step", "rem_pr", "pr_loss",
+    "mat_er", "pr_er", "selectivity", "uniformity"
+)
+
+@st.cache_resource
+def get_connection():
+    # One connection per server process, shared by every session thread. A
+    # transaction belongs to the connection, so each INSERT / read holds the
+    # lock returned alongside it.
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS runs("
+        "date TEXT, sample_id TEXT, time_min REAL, "
+        "mat_depth REAL, total_step REAL, rem_pr REAL, pr_loss REAL, "
+        "mat_er REAL, pr_er REAL, selectivity REAL, uniformity REAL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_date ON runs(date)")
+    conn.commit()
+    return conn, threading.Lock()
+
+def recompute_rates(df):
+    # Bulk version of the per-row rate / selectivity arithmetic: one NumPy
+    # pass over the columns, with the pr_rate > 0 guard done by where=
+    t = df["Time(min)"].to_numpy(dtype=np.float64)
+    mat_er = df["Mat. Depth(nm)"].to_numpy(dtype=np.float64) / t
+    pr_er = df["PR Loss(nm)"].to_numpy(dtype=np.float64) / t
+    selectivity = np.full_like(mat_er, 9999.9)
+    np.divide(mat_er, pr_er, out=selectivity, where=pr_er > 0)
+    df["Mat. ER(nm/min)"] = mat_er
+    df["PR ER(nm/min)"] = pr_er
+    df["Selectivity"] = selectivity
+    return df
+
+def load_recent_rows(conn, lock, limit=HISTORY_LIMIT):
+    # Latest `limit` runs in insertion order; rates are re-derived from the
+    # stored depth / loss / time in bulk
+    with lock:
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(DB_FIELDS)} FROM runs "
+            "WHERE rowid IN (SELECT rowid FROM runs ORDER BY rowid DESC LIMIT ?) ORDER BY rowid",
+            conn, params=(limit,)
+        )
+    df.columns = COLUMNS
+    return recompute_rates(df).to_dict("records")
+
+def insert_rows(conn, lock, entries):
+    # Commits on success, rolls back if the INSERT or commit fails
+    with lock, conn:
+        conn.executemany(
+            f"INSERT INTO runs VALUES ({', '.join('?' * len(DB_FIELDS))})",
+            [tuple(e[c] for c in COLUMNS) for e in entries]
+        )
+
+# Rows are kept as a bounded deque of dicts (appended, oldest first), seeded from the
+# database so the history survives a page refresh; a DataFrame is only
+# built for display / CSV export, so adding a row never copies the history.
+# The buffer lives in session_state, so it is freed when the session ends.
+if 'etching_rows' not in st.session_state:
+    st.session_state.etching_rows = deque(load_recent_rows(*get_connection()), maxlen=HISTORY_MAXLEN)
+
+# A submitted entry is staged here and flushed later in the same run, before
+# anything is displayed: written to the database first, then appended to the
+# buffer. Each submit is flushed by its own run, so this holds at most one
+# row; it exists so that a row whose INSERT fails is kept and retried next run.
+if 'pending_rows' not in st.session_state:
+    st.session_state.pending_rows = []
+
+def flush_pending():
+    # True once the staged entries are saved and in the history
+    pending = st.session_state.pending_rows
+    if not pending:
+        return False
+    try:
+        insert_rows(*get_connection(), pending)
+    except sqlite3.Error as e:
+        st.error(f"Database Error: {e}. The entry will be saved on the next run.")
+        return False
+    st.session_state.etching_rows.extend(pending)
+    pending.clear()
+    return True
+
+# Separators accepted besides whitespace (e.g. values pasted from Excel)
+_SEPARATORS = re.compile(r'[,\t;]+')
+
+def parse_values(text):
+    # C-level tokenizer straight into float64. NumPy < 2 only warns on a
+    # malformed token and returns the values before it, so the count is checked
+    text = _SEPARATORS.sub(' ', text).strip()
+    values = np.fromstring(text, sep=' ', dtype=np.float64)
+    if values.size != len(text.split()):
+        raise ValueError(f"could not parse {text!r} as numbers")
+    return values
+
+def rows_to_csv(rows):
+    # Written straight from the rows with csv.writer - no DataFrame round
+    # trip. Not cached (hashing the rows costs more than encoding them);
+    # the download button calls it only when clicked.
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    for entry in rows:
+        writer.writerow(f"{v:.6g}" if isinstance(v, float) else v for v in (entry[c] for c in COLUMNS))
+    return buf.getvalue().encode('utf-8')
 
 # --- 2. Sidebar: Inputs ---
-with st.sidebar:
+# Inside a form, so edits don't rerun the page until the entry is submitted
+with st.sidebar.form("etch_input", clear_on_submit=False):
     st.header("📝 Measurement Inputs")
     
     # Basic Info
@@ -46,19 +179,21 @@ with st.sidebar:
         "1300 1310 1290 1305"
     )
     
-    add_btn = st.button("Calculate & Add to History", type="primary")
+    add_btn = st.form_submit_button("Calculate & Add to History", type="primary")
 
 # --- 3. Calculation Logic ---
 if add_btn:
     try:
-        # Parse inputs to float lists
-        depth_values = [float(x) for x in mat_depth_str.split()]
-        step_values = [float(x) for x in total_step_str.split()]
-        
-        if len(depth_values) > 0 and len(step_values) > 0 and process_time > 0:
+        # Parse inputs to float arrays
+        depth_values = parse_values(mat_depth_str)
+        step_values = parse_values(total_step_str)
+    except ValueError:
+        st.error("Input Error: Please enter numbers separated by space or comma (e.g., '500 510').")
+    else:
+        if depth_values.size > 0 and step_values.size > 0 and process_time > 0:
             # A. Calculate Averages
-            avg_mat_depth = sum(depth_values) / len(depth_values)
-            avg_total_step = sum(step_values) / len(step_values)
+            avg_mat_depth = depth_values.mean()
+            avg_total_step = step_values.mean()
             
             # B. Calculate PR Details
             # Remaining PR = Total Step - Material Depth
@@ -79,75 +214,76 @@ if add_btn:
             
             # E. Calculate Uniformity (Material Depth)
             # Formula: (Max - Min) / (2 * Avg) * 100
-            d_max = max(depth_values)
-            d_min = min(depth_values)
             if avg_mat_depth > 0:
-                uniformity = ((d_max - d_min) / (2 * avg_mat_depth)) * 100
+                uniformity = (np.ptp(depth_values) / (2 * avg_mat_depth)) * 100
             else:
                 uniformity = 0.0
             
-            # Create Data Dictionary
+            # Create Data Dictionary (raw floats; formatted only for display)
             new_entry = {
                 "Date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
                 "Sample ID": sample_id,
                 "Time(min)": process_time,
-                "Mat. Depth(nm)": f"{avg_mat_depth:.1f}",
-                "Total Step(nm)": f"{avg_total_step:.1f}",
-                "Rem. PR(nm)": f"{avg_rem_pr:.1f}",
-                "PR Loss(nm)": f"{pr_loss:.1f}",
-                "Mat. ER(nm/min)": f"{mat_rate:.2f}",
-                "PR ER(nm/min)": f"{pr_rate:.2f}",
-                "Selectivity": f"{selectivity:.2f}",
-                "Uniformity(±%)": f"{uniformity:.2f}"
+                "Mat. Depth(nm)": avg_mat_depth,
+                "Total Step(nm)": avg_total_step,
+                "Rem. PR(nm)": avg_rem_pr,
+                "PR Loss(nm)": pr_loss,
+                "Mat. ER(nm/min)": mat_rate,
+                "PR ER(nm/min)": pr_rate,
+                "Selectivity": selectivity,
+                "Uniformity(±%)": uniformity
             }
             
-            # Add to History DataFrame
-            new_df = pd.DataFrame([new_entry])
-            st.session_state.etching_history = pd.concat(
-                [new_df, st.session_state.etching_history], 
-                ignore_index=True
-            )
-            
-            st.success(f"Successfully added {sample_id}!")
+            # Stage for History (flushed + persisted before display)
+            st.session_state.pending_rows.append(new_entry)
             
         else:
             st.error("Please enter at least one value for each measurement.")
-            
-    except ValueError:
-        st.error("Input Error: Please enter numbers separated by space (e.g., '500 510').")
 
 # --- 4. Display Results ---
+if flush_pending():
+    st.success(f"Successfully added {st.session_state.etching_rows[-1]['Sample ID']}!")
+rows = st.session_state.etching_rows
 
-# Display Latest Result
-if not st.session_state.etching_history.empty:
-    latest = st.session_state.etching_history.iloc[0]
+# Display Latest Result (plain dict lookups, no Series indexing)
+if rows:
+    latest = rows[-1]
     
     st.subheader(f"📊 Result: {latest['Sample ID']}")
     
     # Row 1: Key Metrics
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Material ER", f"{latest['Mat. ER(nm/min)']} nm/min")
-    col2.metric("PR Etch Rate", f"{latest['PR ER(nm/min)']} nm/min")
-    col3.metric("Selectivity", f"{latest['Selectivity']}")
-    col4.metric("Uniformity", f"± {latest['Uniformity(±%)']} %")
+    col1.metric("Material ER", f"{latest['Mat. ER(nm/min)']:.2f} nm/min")
+    col2.metric("PR Etch Rate", f"{latest['PR ER(nm/min)']:.2f} nm/min")
+    col3.metric("Selectivity", f"{latest['Selectivity']:.2f}")
+    col4.metric("Uniformity", f"± {latest['Uniformity(±%)']:.2f} %")
     
     # Row 2: Thickness Details
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Avg Depth", f"{latest['Mat. Depth(nm)']} nm")
-    col2.metric("Avg Total Step", f"{latest['Total Step(nm)']} nm")
-    col3.metric("Remaining PR", f"{latest['Rem. PR(nm)']} nm")
-    col4.metric("PR Loss", f"{latest['PR Loss(nm)']} nm")
+    col1.metric("Avg Depth", f"{latest['Mat. Depth(nm)']:.1f} nm")
+    col2.metric("Avg Total Step", f"{latest['Total Step(nm)']:.1f} nm")
+    col3.metric("Remaining PR", f"{latest['Rem. PR(nm)']:.1f} nm")
+    col4.metric("PR Loss", f"{latest['PR Loss(nm)']:.1f} nm")
 
 # Display History Table
-st.markdown("---")
-st.subheader("🗂️ Experiment History")
-st.dataframe(st.session_state.etching_history, use_container_width=True)
-
-# CSV Download Button
-csv = st.session_state.etching_history.to_csv(index=False).encode('utf-8')
-st.download_button(
-    label="💾 Download Data as CSV",
-    data=csv,
-    file_name='etching_log.csv',
-    mime='text/csv',
-)
+# Fragment: interacting with the table / download button reruns only this
+# section instead of the whole page
+@st.fragment
+def render_history():
+    rows = st.session_state.etching_rows
+    st.markdown("---")
+    st.subheader("🗂️ Experiment History")
+    hist_df = pd.DataFrame.from_records(list(rows), columns=COLUMNS).astype(DTYPES)
+    # Newest on top: a reversed view, no copy of the underlying data
+    st.dataframe(hist_df.iloc[::-1], column_config=HISTORY_COLUMN_CONFIG, hide_index=True, use_container_width=True)
+
+    # CSV Download Button: encoded on click, from a copy of the rows (the
+    # callable runs on another thread while the page may append to the deque)
+    st.download_button(
+        label="💾 Download Data as CSV",
+        data=lambda: rows_to_csv(reversed(list(rows))),
+        file_name='etching_log.csv',
+        mime='text/csv',
+    )
+
+render_history()